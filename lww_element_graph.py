@@ -7,11 +7,18 @@ The graph contains functionalities to:
 ● check if a vertex is in the graph,
 ● query for all vertices connected to a vertex,
 ● find any path between two vertices
-● merge with concurrent changes from other graph/replica.
+● merge with concurrent changes from other graph/replica,
+● query the graph as of a past timestamp (optional version history),
+● subscribe to a change feed of vertices/edges becoming live or dead,
+● fork the graph in O(1), copying only the values written to afterwards.
 """
 
+import asyncio
+import bisect
 import logging
-from typing import Tuple, Dict, List, Any, Set
+from collections import deque
+from collections.abc import MutableMapping
+from typing import Tuple, Dict, List, Any, Set, Optional, Callable, NamedTuple
 
 logging.basicConfig(format='%(filename)s - %(levelname)s - %(asctime)s %(message)s',
                     datefmt='%m/%d/%Y %I:%M:%S %p',
@@ -59,13 +66,16 @@ class GraphOperations:
         try:
             if vertex1 not in graph.vertices_dict or vertex2 not in graph.vertices_dict:
                 return False  # edge does not exist, because at least one of the vertices does not exist
-            elif (vertex1, vertex2) not in graph.add_edges_dict and (vertex2, vertex1) not in graph.add_edges_dict:
+            keys = [(vertex1, vertex2), (vertex2, vertex1)]  # the edge can be stored in either direction
+            added = [graph.add_edges_dict[key] for key in keys if key in graph.add_edges_dict]
+            removed = [graph.remove_edges_dict[key] for key in keys if key in graph.remove_edges_dict]
+            if not added:
                 return False  # edge does not exist
-            elif (vertex1, vertex2) not in graph.remove_edges_dict or (vertex2, vertex1) not in graph.remove_edges_dict:
+            elif not removed:
                 return True  # edge was added and not removed, so it exists
-            elif graph.remove_edges_dict[vertex1][vertex2] > graph.add_edges_dict[vertex1][vertex2]:
+            elif max(removed) > max(added):
                 return False  # edge was removed after it was added
-            elif graph.remove_edges_dict[vertex1][vertex2] == graph.add_edges_dict[vertex1][vertex2]:
+            elif max(removed) == max(added):
                 return True  # edge was added and removed at the same timestamp, it exists, because of the addition bias
             else:
                 return True  # edge was added before it was removed, it exists
@@ -90,7 +100,7 @@ class GraphOperations:
                     logger.debug(f"Vertex {vertex} was removed before this timestamp.")
                     graph.remove_vertices_dict.pop(vertex)  # remove vertex from remove_vertices
                     graph.add_vertices_dict[vertex] = timestamp  # add vertex to add_vertices
-                    graph.vertices_dict[vertex] = []  # add vertex to vertices
+                    GraphOperations.refresh_adjacency(graph, [vertex], [])  # add vertex and its edges to vertices
                     logger.info(f"Vertex {vertex} was added to the graph.")
                     return True  # vertex was removed before, but added now
                 else:
@@ -99,7 +109,7 @@ class GraphOperations:
                     return False  # vertex was removed after this timestamp
             else:
                 graph.add_vertices_dict[vertex] = timestamp
-                graph.vertices_dict[vertex] = []
+                GraphOperations.refresh_adjacency(graph, [vertex], [])  # add vertex and its edges to vertices
                 logger.info(f"Vertex {vertex} was added to the graph.")
                 return True  # vertex was added
         except TypeError:
@@ -110,38 +120,32 @@ class GraphOperations:
     def add_edge(graph, edge: Tuple[int, int], timestamp: float) -> bool:
         """
         Add an edge to the graph.
+        Timestamps of both directions of the edge are compared, as in edge_exists.
         :param graph to add edge to.
         :param edge: edge to be added.
         :param timestamp: timestamp of the operation.
         """
         try:
+            if edge[0] not in graph.vertices_dict or edge[1] not in graph.vertices_dict:
+                logger.warning(f"Edge {edge} is not in the graph.")
+                return None  # at least one of the vertices does not exist, so the edge cannot be added
             if GraphOperations.edge_exists(graph, edge[0], edge[1]):
                 logger.warning("Edge {} already exists in the graph.".format(edge))
                 return False  # edge already exists
-            if edge in graph.remove_edges_dict:
-                if graph.remove_edges_dict[edge] <= timestamp:
-                    logger.debug(f"Edge {edge} was removed before.")
-                    graph.remove_edges_dict.pop(edge)  # remove edge from remove_edges
-                    graph.add_edges_dict[edge] = timestamp  # add edge to add_edges
-                    graph.vertices_dict[edge[0]].append(edge[1])  # add edge to vertices
-                    graph.vertices_dict[edge[1]].append(edge[0])  # add edge to vertices
-                    logger.info(f"Edge {edge} was added.")
-                    return True  # edge was removed before, but added now
-                else:
-                    logger.debug(f"Edge {edge} was removed after this timestamp.")
-                    return False  # edge was removed after this timestamp
-            else:
-                graph.add_edges_dict[edge] = timestamp
-                graph.vertices_dict[edge[0]].append(edge[1])  # add edge to vertices
-                graph.vertices_dict[edge[1]].append(edge[0])  # add edge to vertices
-                logger.info(f"Edge {edge} was added.")
-                return True  # edge was added
+            removed = GraphOperations.edge_timestamp(graph.remove_edges_dict, edge)
+            if removed is not None and removed > timestamp:
+                logger.debug(f"Edge {edge} was removed after this timestamp.")
+                return False  # edge was removed after this timestamp
+            for key in GraphOperations.edge_keys(edge):
+                graph.remove_edges_dict.pop(key, None)  # remove edge from remove_edges
+            graph.add_edges_dict[edge] = timestamp  # add edge to add_edges
+            GraphOperations.index_edge(graph, edge)
+            GraphOperations.refresh_adjacency(graph, [], [edge])  # add edge to vertices
+            logger.info(f"Edge {edge} was added.")
+            return True  # edge was added, or removed before, but added now
         except TypeError:
             logger.error(f"Edge {edge} is not a tuple.")
             return None
-        except KeyError:
-            logger.warning(f"Edge {edge} is not in the graph.")
-            return None
 
     @staticmethod
     def remove_vertex(graph, vertex: int, timestamp: int) -> bool:
@@ -154,14 +158,15 @@ class GraphOperations:
         try:
             if not GraphOperations.vertex_exists(graph, vertex):
                 logger.debug(f"Vertex {vertex} does not exist in the graph.")
-                graph.remove_vertices_dict[vertex] = timestamp  # add vertex to remove_vertices
+                if vertex not in graph.remove_vertices_dict or graph.remove_vertices_dict[vertex] < timestamp:
+                    graph.remove_vertices_dict[vertex] = timestamp  # keep the latest removal, like merge does
                 return False  # vertex does not exist
             if vertex in graph.add_vertices_dict:
                 if graph.add_vertices_dict[vertex] < timestamp:
                     logger.debug(f"Vertex {vertex} was added before.")
                     graph.add_vertices_dict.pop(vertex)  # remove vertex from add_vertices
                     graph.remove_vertices_dict[vertex] = timestamp  # add vertex to remove_vertices
-                    graph.vertices_dict.pop(vertex)  # remove vertex from vertices
+                    GraphOperations.refresh_adjacency(graph, [vertex], [])  # remove vertex and its edges from vertices
                     logger.info(f"Vertex {vertex} was removed.")
                     return True  # vertex was added before, but removed now
                 else:
@@ -169,7 +174,7 @@ class GraphOperations:
                     return False  # vertex was added after this timestamp
             else:
                 graph.remove_vertices_dict[vertex] = timestamp
-                graph.vertices_dict.pop(vertex)  # remove vertex from vertices
+                GraphOperations.refresh_adjacency(graph, [vertex], [])  # remove vertex and its edges from vertices
                 logger.info(f"Vertex {vertex} was removed.")
                 return True  # vertex was removed
         except TypeError:
@@ -180,6 +185,7 @@ class GraphOperations:
     def remove_edge(graph, edge: Tuple[int, int], timestamp: float) -> bool:
         """
         Remove an edge from the graph.
+        Timestamps of both directions of the edge are compared, as in edge_exists.
         :param graph to remove edge from.
         :param edge: edge to be removed.
         :param timestamp: timestamp of the operation.
@@ -187,24 +193,117 @@ class GraphOperations:
         if not graph.edge_exists(edge):
             logger.debug(f"Edge {edge} does not exist in the graph.")
             return False  # edge does not exist, so it cannot be removed
-        if edge in graph.add_edges_dict:
-            if graph.add_edges_dict[edge] < timestamp:
-                logger.debug(f"Edge {edge} was added before.")
-                graph.add_edges_dict.pop(edge)  # remove edge from add_edges
-                graph.remove_edges_dict[edge] = timestamp  # add edge to remove_edges
-                graph.vertices_dict[edge[0]].remove(edge[1])  # remove edge from vertices
-                graph.vertices_dict[edge[1]].remove(edge[0])  # remove edge from vertices
-                logger.info(f"Edge {edge} was removed.")
-                return True  # edge was added before, but removed now
-            else:
-                logger.warning("Edge {} was added after this timestamp.".format(edge))
-                return False  # edge was added after this timestamp
-        else:
-            graph.remove_edges_dict[edge] = timestamp
-            graph.vertices_dict[edge[0]].remove(edge[1])  # remove edge from vertices
-            graph.vertices_dict[edge[1]].remove(edge[0])  # remove edge from vertices
-            logger.info(f"Edge {edge} was removed.")
-            return True  # edge was removed
+        if GraphOperations.edge_timestamp(graph.add_edges_dict, edge) >= timestamp:
+            logger.warning("Edge {} was added after this timestamp.".format(edge))
+            return False  # edge was added after this timestamp
+        logger.debug(f"Edge {edge} was added before.")
+        for key in GraphOperations.edge_keys(edge):
+            graph.add_edges_dict.pop(key, None)  # remove edge from add_edges
+        graph.remove_edges_dict[edge] = timestamp  # add edge to remove_edges
+        GraphOperations.refresh_adjacency(graph, [], [edge])  # remove edge from vertices
+        logger.info(f"Edge {edge} was removed.")
+        return True  # edge was added before, but removed now
+
+    @staticmethod
+    def edge_keys(edge: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """
+        Get the keys an edge can be stored under, as it can be stored in either direction.
+        :param edge: edge to get the keys of.
+        :return: list of the keys.
+        """
+        return [(edge[0], edge[1]), (edge[1], edge[0])]
+
+    @staticmethod
+    def edge_timestamp(table: Dict[Tuple[int, int], float], edge: Tuple[int, int]) -> Optional[float]:
+        """
+        Get the latest timestamp of an edge in either direction.
+        :param table: add or remove timestamps of edges.
+        :param edge: edge to get the timestamp of.
+        :return: the latest timestamp, None if the edge is in neither direction.
+        """
+        timestamps = [table[key] for key in GraphOperations.edge_keys(edge) if key in table]
+        return max(timestamps) if timestamps else None
+
+    @staticmethod
+    def index_edge(graph, edge: Tuple[int, int]) -> None:
+        """
+        Add an edge to the incident edges of its vertices.
+        :param graph to index edge in.
+        :param edge: edge to be indexed.
+        """
+        if edge in graph.incident_edges_dict.get(edge[0], {}):
+            return  # edge is already indexed
+        for vertex in (edge[0], edge[1]):
+            GraphOperations.owned(graph.incident_edges_dict, vertex, dict).setdefault(vertex, {})[edge] = None
+
+    @staticmethod
+    def refresh_adjacency(graph, vertices: List[int], edges: List[Tuple[int, int]]) -> None:
+        """
+        Bring the adjacency lists of vertices and edges whose timestamps changed in line with the timestamps.
+        A vertex that appeared or disappeared also refreshes its incident edges.
+        :param graph to refresh adjacency lists of.
+        :param vertices: vertices whose timestamps changed.
+        :param edges: edges whose timestamps changed.
+        """
+        edges = list(edges)
+        for vertex in vertices:
+            exists = GraphOperations.vertex_exists(graph, vertex)
+            if exists and vertex not in graph.vertices_dict:
+                graph.vertices_dict[vertex] = []  # add vertex to vertices
+                edges.extend(graph.incident_edges_dict.get(vertex, {}))
+            elif not exists and vertex in graph.vertices_dict:
+                for neighbour in graph.vertices_dict.pop(vertex):  # remove vertex from vertices
+                    if neighbour != vertex:
+                        GraphOperations.remove_neighbour(graph, neighbour, vertex)  # remove edge from vertices
+        refreshed = set()
+        for edge in edges:
+            key = frozenset((edge[0], edge[1]))
+            if key in refreshed:
+                continue  # edge is stored in both directions and was already refreshed
+            refreshed.add(key)
+            exists = GraphOperations.edge_exists(graph, edge[0], edge[1])
+            listed = edge[0] in graph.vertices_dict and edge[1] in graph.vertices_dict[edge[0]]
+            if exists and not listed:
+                GraphOperations.adjacency(graph, edge[0]).append(edge[1])  # add edge to vertices
+                GraphOperations.adjacency(graph, edge[1]).append(edge[0])  # add edge to vertices
+            elif listed and not exists:
+                GraphOperations.remove_neighbour(graph, edge[0], edge[1])  # remove edge from vertices
+                GraphOperations.remove_neighbour(graph, edge[1], edge[0])  # remove edge from vertices
+
+    @staticmethod
+    def owned(table: Dict[Any, Any], key: Any, kind: type) -> Dict[Any, Any]:
+        """
+        Get a dict whose value at a key can be changed in place, copying the value first if it is shared with a fork.
+        :param table: dict of the value.
+        :param key: key of the value.
+        :param kind: type of the value, used to copy it.
+        :return: the dict.
+        """
+        if isinstance(table, CopyOnWriteDict):
+            table.own(key, kind)
+        return table
+
+    @staticmethod
+    def adjacency(graph, vertex: int) -> list:
+        """
+        Get the adjacency list of a vertex to be changed in place.
+        :param graph to get adjacency list from.
+        :param vertex: vertex of the adjacency list.
+        :return: adjacency list of the vertex.
+        """
+        return GraphOperations.owned(graph.vertices_dict, vertex, list)[vertex]
+
+    @staticmethod
+    def remove_neighbour(graph, vertex: int, neighbour: int) -> None:
+        """
+        Remove a vertex from the adjacency list of another vertex, if it is there.
+        A vertex that was removed and added again starts with an empty adjacency list.
+        :param graph to remove neighbour from.
+        :param vertex: vertex whose adjacency list is changed.
+        :param neighbour: vertex to be removed from the adjacency list.
+        """
+        if neighbour in graph.vertices_dict.get(vertex, []):
+            GraphOperations.adjacency(graph, vertex).remove(neighbour)
 
     @staticmethod
     def get_vertices(graph, vertex: int) -> list:
@@ -271,21 +370,486 @@ class GraphOperations:
         return one
 
 
-class Graph:
+class CopyOnWriteDict(MutableMapping):
+    """
+    Dict that shares a read-only base with its forks and keeps its own changes on top of it,
+    so forking copies nothing and a write copies only the value written.
+    Values read through the base are shared with the forks, see own. Iteration follows the base,
+    then the keys added on top of it, like the insertion order of a dict.
+    """
+    max_depth = 8  # forks of forks stacked on top of each other before the dict is flattened
+
+    def __init__(self, base: Dict[Any, Any]):
+        """
+        Initialize the dict on top of a base, which must not be written to anymore.
+        :param base: dict, or CopyOnWriteDict, to share.
+        """
+        self._base = base
+        self._changes: Dict[Any, Any] = {}  # values written since the fork
+        self._deleted: Set[Any] = set()  # keys of the base deleted since the fork, even if written again
+        self._len = len(base)
+        self._depth = base._depth + 1 if isinstance(base, CopyOnWriteDict) else 1
+
+    def __getitem__(self, key: Any) -> Any:
+        if key in self._changes:
+            return self._changes[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        return self._base[key]
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._changes or (key not in self._deleted and key in self._base)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        if key not in self:
+            self._len += 1
+        self._changes[key] = value
+        self._flatten_if_needed()
+
+    def __delitem__(self, key: Any) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._changes.pop(key, None)
+        if key in self._base:
+            self._deleted.add(key)
+        self._len -= 1
+        self._flatten_if_needed()
+
+    def __iter__(self):
+        for key in self._base:
+            if key not in self._deleted:
+                yield key
+        for key in self._changes:
+            if key in self._deleted or key not in self._base:
+                yield key
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def own(self, key: Any, kind: type) -> None:
+        """
+        Copy a value read through the base, so it can be changed in place without changing it in the forks.
+        :param key: key of the value.
+        :param kind: type of the value, used to copy it.
+        """
+        if key not in self._changes and key in self:
+            self._changes[key] = kind(self[key])
+
+    def _flatten_if_needed(self) -> None:
+        """
+        Copy the dict into a new base once its changes outgrow the base or too many forks are stacked,
+        which keeps lookups fast and costs O(1) amortized per write.
+        """
+        if self._depth <= self.max_depth and len(self._changes) + len(self._deleted) <= max(len(self._base), 64):
+            return
+        self._base = dict(self.items())
+        self._changes = {}
+        self._deleted = set()
+        self._depth = 1
+
+
+class CopyOnWrite:
+    """
+    Base class for structures that can be forked in O(1).
+    A fork and the original put their dicts in CopyOnWriteDicts on top of the same base,
+    and a list/dict value in a dict is copied on the first write to its key.
+    """
+
+    def _fork_into(self, clone, names: Tuple[str, ...]) -> None:
+        """
+        Share the dicts with a clone, both keep their changes on top of them.
+        :param clone: structure to share the dicts with.
+        :param names: names of the dicts.
+        """
+        for name in names:
+            table = getattr(self, name)
+            for fork in (self, clone):
+                setattr(fork, name, CopyOnWriteDict(table))
+
+    def _own(self, name: str, key: Any, kind: type) -> Dict[Any, Any]:
+        """
+        Get a dict whose value at a key can be changed in place.
+        :param name: name of the dict.
+        :param key: key of the value.
+        :param kind: type of the value, used to copy it.
+        :return: the dict.
+        """
+        return GraphOperations.owned(getattr(self, name), key, kind)
+
+
+class GraphHistory(CopyOnWrite):
+    """
+    Optional per-element version history of a graph.
+    Every element keeps a sorted list of (timestamp, added) versions, so the state of the element
+    at any timestamp is the last version at or before it. Lists are bounded by `limit` per element,
+    and an element whose oldest versions were dropped keeps a horizon, before which its state is unknown.
+    """
+
+    def __init__(self, limit: int):
+        """
+        Initialize the history.
+        :param limit: maximum number of versions kept per element.
+        """
+        self.limit = limit
+        self.vertex_versions: Dict[int, List[Tuple[float, bool]]] = {}
+        self.edge_versions: Dict[Tuple[int, int], List[Tuple[float, bool]]] = {}  # keyed by GraphHistory.edge_key
+        self.vertex_horizons: Dict[int, float] = {}
+        self.edge_horizons: Dict[Tuple[int, int], float] = {}
+        self.adjacency: Dict[int, Dict[int, None]] = {}  # every neighbour a vertex ever had, in insertion order
+
+    @staticmethod
+    def edge_key(edge: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Get the key of an edge regardless of its direction, as an edge can be stored in either direction.
+        :param edge: edge to get the key of.
+        :return: the edge with its smaller vertex first.
+        """
+        return (edge[0], edge[1]) if edge[0] <= edge[1] else (edge[1], edge[0])
+
+    def record_vertex(self, vertex: int, timestamp: float, added: bool) -> None:
+        """
+        Record an add/remove operation of a vertex.
+        :param vertex: vertex of the operation.
+        :param timestamp: timestamp of the operation.
+        :param added: True for addition, False for removal.
+        """
+        try:
+            self._record("vertex_versions", "vertex_horizons", vertex, timestamp, added)
+        except TypeError:
+            logger.error(f"TypeError in record_vertex: {vertex}")
+
+    def record_edge(self, edge: Tuple[int, int], timestamp: float, added: bool) -> None:
+        """
+        Record an add/remove operation of an edge.
+        :param edge: edge of the operation.
+        :param timestamp: timestamp of the operation.
+        :param added: True for addition, False for removal.
+        """
+        try:
+            self._record("edge_versions", "edge_horizons", self.edge_key(edge), timestamp, added)
+            self._own("adjacency", edge[0], dict).setdefault(edge[0], {})[edge[1]] = None
+            self._own("adjacency", edge[1], dict).setdefault(edge[1], {})[edge[0]] = None
+        except (TypeError, IndexError):
+            logger.error(f"Error in record_edge: {edge}")
+
+    def fork(self):
+        """
+        Fork the history in O(1), the fork and the original copy what they write to.
+        :return: the forked history.
+        """
+        clone = GraphHistory(self.limit)
+        self._fork_into(clone, ("vertex_versions", "edge_versions", "vertex_horizons", "edge_horizons", "adjacency"))
+        return clone
+
+    def record_graph(self, graph) -> None:
+        """
+        Record the versions of another graph, e.g. a replica being merged.
+        Horizons of the other history are carried over, as the state before them is unknown to the other
+        graph's versions too. If the graph keeps no history, only its current add/remove timestamps are recorded.
+        :param graph: graph to take versions from.
+        """
+        if graph.history is not None:
+            for vertex, horizon in graph.history.vertex_horizons.items():
+                self._advance_horizon("vertex_versions", "vertex_horizons", vertex, horizon)
+            for edge, horizon in graph.history.edge_horizons.items():
+                self._advance_horizon("edge_versions", "edge_horizons", edge, horizon)
+            for vertex, versions in graph.history.vertex_versions.items():
+                for timestamp, added in versions:
+                    self.record_vertex(vertex, timestamp, added)
+            for edge, versions in graph.history.edge_versions.items():
+                for timestamp, added in versions:
+                    self.record_edge(edge, timestamp, added)
+            return
+        for vertex, timestamp in graph.add_vertices_dict.items():
+            self.record_vertex(vertex, timestamp, True)
+        for vertex, timestamp in graph.remove_vertices_dict.items():
+            self.record_vertex(vertex, timestamp, False)
+        for edge, timestamp in graph.add_edges_dict.items():
+            self.record_edge(edge, timestamp, True)
+        for edge, timestamp in graph.remove_edges_dict.items():
+            self.record_edge(edge, timestamp, False)
+
+    def vertex_alive_at(self, vertex: int, timestamp: float) -> Optional[bool]:
+        """
+        Check if a vertex was alive at a timestamp, see alive_at.
+        """
+        return self.alive_at(self.vertex_versions.get(vertex), self.vertex_horizons.get(vertex), timestamp)
+
+    def edge_alive_at(self, edge: Tuple[int, int], timestamp: float) -> Optional[bool]:
+        """
+        Check if an edge was alive at a timestamp in either direction, see alive_at.
+        """
+        key = self.edge_key(edge)
+        return self.alive_at(self.edge_versions.get(key), self.edge_horizons.get(key), timestamp)
+
+    def _record(self, name: str, horizons: str, key: Any, timestamp: float, added: bool) -> None:
+        """
+        Insert a version keeping the list sorted, and compact the list if it grew over the limit.
+        Versions already recorded, e.g. by merging the same replica twice, and versions older than
+        the horizon of the element are skipped.
+        :param name: name of the versions dict.
+        :param horizons: name of the horizons dict.
+        :param key: element of the operation.
+        :param timestamp: timestamp of the operation.
+        :param added: True for addition, False for removal.
+        """
+        horizon = getattr(self, horizons).get(key)
+        if horizon is not None and timestamp < horizon:
+            return  # the state before the horizon is unknown anyway
+        versions = self._own(name, key, list).setdefault(key, [])
+        version = (timestamp, added)
+        index = bisect.bisect_left(versions, version)
+        if index < len(versions) and versions[index] == version:
+            return  # version is already recorded
+        versions.insert(index, version)
+        if len(versions) > self.limit:
+            self._compact(versions, horizons, key)
+
+    def _compact(self, versions: List[Tuple[float, bool]], horizons: str, key: Any) -> None:
+        """
+        Compact versions of an element in place, dropping the oldest versions over the limit.
+        The horizon of the element moves to the oldest version kept, as a merge may still bring in versions
+        between the dropped ones, whose answers would otherwise be wrong.
+        :param versions: versions of an element.
+        :param horizons: name of the horizons dict.
+        :param key: element of the versions.
+        """
+        del versions[:-self.limit]
+        getattr(self, horizons)[key] = versions[0][0]
+
+    def _advance_horizon(self, name: str, horizons: str, key: Any, horizon: float) -> None:
+        """
+        Move the horizon of an element forward, dropping the versions older than the horizon.
+        :param name: name of the versions dict.
+        :param horizons: name of the horizons dict.
+        :param key: element of the versions.
+        :param horizon: new horizon of the element, ignored if the element has a later one.
+        """
+        if getattr(self, horizons).get(key, horizon) > horizon:
+            return  # the element already has a later horizon
+        getattr(self, horizons)[key] = horizon
+        versions = getattr(self, name).get(key)
+        if versions and versions[0][0] < horizon:
+            del self._own(name, key, list)[key][:bisect.bisect_left(versions, (horizon, False))]
+
+    @staticmethod
+    def alive_at(versions: Optional[List[Tuple[float, bool]]], horizon: Optional[float],
+                 timestamp: float) -> Optional[bool]:
+        """
+        Check if an element was alive at a timestamp.
+        An addition and a removal at the same timestamp resolve to alive, because of the addition bias.
+        :param versions: versions of an element.
+        :param horizon: timestamp of the oldest version kept, if older versions were dropped.
+        :param timestamp: timestamp to check at.
+        :return: True if the last version at or before the timestamp is an addition, False otherwise,
+        None if the timestamp is before the horizon.
+        """
+        if horizon is not None and timestamp < horizon:
+            return None  # older versions were dropped, so the state is unknown
+        if not versions:
+            return False
+        index = bisect.bisect_right(versions, (timestamp, True)) - 1
+        return index >= 0 and versions[index][1]
+
+
+class GraphView:
+    """
+    Read-only view of a graph as of a timestamp.
+    The view reads the version history of the graph, so it is cheap to create and does not copy the graph.
+    Elements whose history does not reach back to the timestamp are unknown: their checks return None
+    and they are left out of get_vertices and find_path.
+    """
+
+    def __init__(self, history: GraphHistory, timestamp: float):
+        """
+        Initialize the view.
+        :param history: version history of the graph.
+        :param timestamp: timestamp of the view.
+        """
+        self.history = history
+        self.timestamp = timestamp
+
+    def vertex_exists(self, v: int) -> Optional[bool]:
+        """
+        Check if a vertex existed at the timestamp of the view.
+        """
+        try:
+            alive = self.history.vertex_alive_at(v, self.timestamp)
+        except TypeError:
+            logger.error(f"TypeError in vertex_exists: {v}")
+            return None
+        if alive is None:
+            logger.error(f"Version history of vertex {v} does not reach back to {self.timestamp}.")
+        return alive
+
+    def edge_exists(self, e: Tuple[int, int]) -> Optional[bool]:
+        """
+        Check if an edge existed at the timestamp of the view.
+        """
+        try:
+            vertices_alive = [self.vertex_exists(e[0]), self.vertex_exists(e[1])]
+            if False in vertices_alive:
+                return False  # edge does not exist, because at least one of the vertices does not exist
+            if None in vertices_alive:
+                return None  # at least one of the vertices is unknown
+            alive = self.history.edge_alive_at(e, self.timestamp)
+        except (TypeError, IndexError):
+            logger.error(f"Error in edge_exists: {e}")
+            return None
+        if alive is None:
+            logger.error(f"Version history of edge {e} does not reach back to {self.timestamp}.")
+        return alive
+
+    def get_vertices(self, v: int) -> List[int]:
+        """
+        Get all vertices connected to a vertex at the timestamp of the view.
+        """
+        if not self.vertex_exists(v):
+            return []  # vertex does not exist, so it cannot have any adjacent vertices
+        return [node for node in self.history.adjacency.get(v, {}) if self.edge_exists((v, node))]
+
+    def find_path(self, v1: int, v2: int) -> List[int]:
+        """
+        Find a path between two vertices at the timestamp of the view.
+        """
+        if not self.vertex_exists(v1) or not self.vertex_exists(v2):
+            return []  # start or end vertex does not exist, so there is no path
+        if v1 == v2:
+            return [v1]
+        parents: Dict[int, Optional[int]] = {v1: None}
+        queue = deque([v1])
+        while queue:
+            node = queue.popleft()
+            for neighbour in self.get_vertices(node):
+                if neighbour in parents:
+                    continue
+                parents[neighbour] = node
+                if neighbour == v2:
+                    path = [v2]
+                    while parents[path[-1]] is not None:
+                        path.append(parents[path[-1]])
+                    return path[::-1]
+                queue.append(neighbour)
+        return []  # there is no path between the vertices
+
+
+class GraphChange(NamedTuple):
+    """ Effective state transition of a vertex or an edge. """
+    kind: str  # "vertex" or "edge"
+    element: Any  # vertex or edge
+    alive: bool  # True if the element became live, False if it became dead
+    timestamp: float  # timestamp of the operation that decided the new state
+
+
+class ChangeFeed:
+    """
+    Change feed of a graph.
+    Subscribers are either callbacks, called synchronously with every change, or bounded asyncio queues,
+    which drop their oldest change when full. Changes are only computed while there are subscribers.
+    """
+
+    def __init__(self):
+        """
+        Initialize the change feed.
+        """
+        self.callbacks: List[Callable[[GraphChange], Any]] = []
+        self.queues: List[asyncio.Queue] = []
+
+    @property
+    def has_subscribers(self) -> bool:
+        """
+        Check if anyone is subscribed to the change feed.
+        """
+        return len(self.callbacks) > 0 or len(self.queues) > 0
+
+    def subscribe(self, callback: Callable[[GraphChange], Any]) -> Callable[[GraphChange], Any]:
+        """
+        Subscribe a callback to the change feed.
+        :param callback: function called with every change.
+        :return: the callback, to be passed to unsubscribe.
+        """
+        self.callbacks.append(callback)
+        return callback
+
+    def unsubscribe(self, callback: Callable[[GraphChange], Any]) -> bool:
+        """
+        Unsubscribe a callback from the change feed.
+        :param callback: callback to be unsubscribed.
+        :return: True if the callback was subscribed, False otherwise.
+        """
+        if callback not in self.callbacks:
+            return False
+        self.callbacks.remove(callback)
+        return True
+
+    def subscribe_queue(self, maxsize: int = 1024) -> asyncio.Queue:
+        """
+        Subscribe a bounded asyncio queue to the change feed.
+        Changes are put without waiting, so the queue must be consumed on the thread that mutates the graph.
+        :param maxsize: maximum number of changes kept in the queue.
+        :return: the queue, to be passed to unsubscribe_queue.
+        """
+        queue = asyncio.Queue(maxsize)
+        self.queues.append(queue)
+        return queue
+
+    def unsubscribe_queue(self, queue: asyncio.Queue) -> bool:
+        """
+        Unsubscribe a queue from the change feed.
+        :param queue: queue to be unsubscribed.
+        :return: True if the queue was subscribed, False otherwise.
+        """
+        if queue not in self.queues:
+            return False
+        self.queues.remove(queue)
+        return True
+
+    def publish(self, changes: List[GraphChange]) -> None:
+        """
+        Publish changes to all subscribers.
+        :param changes: changes to be published.
+        """
+        for change in changes:
+            for callback in self.callbacks:
+                try:
+                    callback(change)
+                except Exception as e:
+                    logger.error(f"Error in change feed callback: {e}")
+            for queue in self.queues:
+                if queue.full():
+                    dropped = queue.get_nowait()
+                    queue.task_done()  # the dropped change will never be processed
+                    logger.warning(f"Change feed queue is full, dropped change {dropped}.")
+                queue.put_nowait(change)
+
+
+class Graph(CopyOnWrite):
     """ Graph class. """
     timestamp = float
     vertex = int
     edge = Tuple[vertex, vertex]
+    vertex_tables = ("add_vertices_dict", "remove_vertices_dict", "vertices_dict")
+    vertex_timestamps = ("add_vertices_dict", "remove_vertices_dict")
+    edge_tables = ("add_edges_dict", "remove_edges_dict")
+    index_tables = ("incident_edges_dict",)
 
-    def __init__(self):
+    def __init__(self, history_limit: int = 0):
         """
         Initialize the graph.
+        :param history_limit: number of versions kept per element for `as_of` queries, 0 disables the history.
         """
         self.add_vertices_dict: Dict[int, int] = {}
         self.add_edges_dict: Dict[Graph.edge, int] = {}
         self.remove_vertices_dict: Dict[int, int] = {}
         self.remove_edges_dict: Dict[Graph.edge, int] = {}
         self.vertices_dict: Dict[int, List[int]] = {}
+        self.incident_edges_dict: Dict[int, Dict[Graph.edge, None]] = {}  # every edge ever added, per vertex
+
+        self.history: Optional[GraphHistory] = GraphHistory(history_limit) if history_limit > 0 else None
+        self.changes = ChangeFeed()
 
         self.op = GraphOperations()
 
@@ -305,25 +869,52 @@ class Graph:
         """
         Add a vertex to the graph.
         """
-        return self.op.add_vertex(self, v, t)
+        watched = self._watch([v], self._incident_edges([v])) if self.changes.has_subscribers else None
+        stored = self._stored(self.vertex_timestamps, v) if self.history is not None else None
+        result = self.op.add_vertex(self, v, t)
+        if stored is not None:
+            self._record_stored(self.vertex_timestamps, v, stored, self.history.record_vertex)
+        if watched is not None:
+            self._publish_changes(watched)
+        return result
 
     def remove_vertex(self, v: vertex, t: timestamp) -> bool:
         """
         Remove a vertex from the graph.
         """
-        return self.op.remove_vertex(self, v, t)
+        watched = self._watch([v], self._incident_edges([v])) if self.changes.has_subscribers else None
+        stored = self._stored(self.vertex_timestamps, v) if self.history is not None else None
+        result = self.op.remove_vertex(self, v, t)
+        if stored is not None:
+            self._record_stored(self.vertex_timestamps, v, stored, self.history.record_vertex)
+        if watched is not None:
+            self._publish_changes(watched)
+        return result
 
     def add_edge(self, e: edge, t: timestamp) -> bool:
         """
         Add an edge to the graph.
         """
-        return self.op.add_edge(self, e, t)
+        watched = self._watch([], [e]) if self.changes.has_subscribers else None
+        stored = self._stored(self.edge_tables, e) if self.history is not None else None
+        result = self.op.add_edge(self, e, t)
+        if stored is not None:
+            self._record_stored(self.edge_tables, e, stored, self.history.record_edge)
+        if watched is not None:
+            self._publish_changes(watched)
+        return result
 
     def remove_edge(self, e: edge, t: timestamp) -> None:
         """
         Remove an edge from the graph.
         """
+        watched = self._watch([], [e]) if self.changes.has_subscribers else None
+        stored = self._stored(self.edge_tables, e) if self.history is not None else None
         self.op.remove_edge(self, e, t)
+        if stored is not None:
+            self._record_stored(self.edge_tables, e, stored, self.history.record_edge)
+        if watched is not None:
+            self._publish_changes(watched)
 
     def get_vertices(self, v: vertex) -> List[vertex]:
         """
@@ -342,15 +933,133 @@ class Graph:
         Merge with concurrent changes from other graph/replica.
         """
         try:
+            watched = None
+            if self.changes.has_subscribers:
+                vertices = {**other_graph.add_vertices_dict, **other_graph.remove_vertices_dict}
+                edges = {**other_graph.add_edges_dict, **other_graph.remove_edges_dict}
+                edges.update((edge, None) for edge in self._incident_edges(vertices, other_graph))
+                watched = self._watch(list(vertices), list(edges))
             self.add_vertices_dict = self.op.merge(self.add_vertices_dict, other_graph.add_vertices_dict)
             self.add_edges_dict = self.op.merge(self.add_edges_dict, other_graph.add_edges_dict)
             self.remove_vertices_dict = self.op.merge(self.remove_vertices_dict, other_graph.remove_vertices_dict)
             self.remove_edges_dict = self.op.merge(self.remove_edges_dict, other_graph.remove_edges_dict)
-            self.vertices_dict = self.op.merge(self.vertices_dict, other_graph.vertices_dict)
-            logger.debug(
-                f"Merged graph: {self.add_vertices_dict}, {self.add_edges_dict}, {self.remove_vertices_dict}, {self.remove_edges_dict}, {self.vertices_dict}")
+            for edge in other_graph.add_edges_dict:
+                self.op.index_edge(self, edge)
+            self.op.refresh_adjacency(
+                self, list(other_graph.add_vertices_dict) + list(other_graph.remove_vertices_dict),
+                list(other_graph.add_edges_dict) + list(other_graph.remove_edges_dict))
+            if self.history is not None:
+                self.history.record_graph(other_graph)
+            if watched is not None:
+                self._publish_changes(watched)
+            if logger.isEnabledFor(logging.DEBUG):  # formatting the whole graph is O(V + E)
+                logger.debug(
+                    f"Merged graph: {self.add_vertices_dict}, {self.add_edges_dict}, {self.remove_vertices_dict}, {self.remove_edges_dict}, {self.vertices_dict}")
         except Exception as e:
             logger.error(f"Error merging graph: {e}")
         return self
 
+    def fork(self):
+        """
+        Fork the graph into an independent replica in O(1).
+        Both graphs share their dicts until they write to them. The fork has no change feed subscribers.
+        """
+        clone = Graph()
+        self._fork_into(clone, self.vertex_tables + self.edge_tables + self.index_tables)
+        clone.history = self.history.fork() if self.history is not None else None
+        return clone
+
+    def snapshot(self):
+        """
+        Take a snapshot of the graph in O(1), e.g. to run a speculative merge on it or to roll back to it.
+        """
+        return self.fork()
 
+    def as_of(self, t: timestamp) -> Optional[GraphView]:
+        """
+        Get a read-only view of the graph as of a timestamp.
+        Requires the graph to be created with a history_limit.
+        """
+        if self.history is None:
+            logger.error("Graph has no version history, create it with a history_limit to use as_of.")
+            return None
+        return GraphView(self.history, t)
+
+    def _incident_edges(self, vertices, other_graph=None) -> List[edge]:
+        """
+        Get all edges ever added to this graph (and to other_graph, if given) with an end in the given vertices.
+        """
+        edges: Dict[Graph.edge, None] = {}
+        try:
+            for graph in (self, other_graph) if other_graph is not None else (self,):
+                for v in vertices:
+                    edges.update(graph.incident_edges_dict.get(v, {}))
+        except TypeError:
+            logger.error(f"TypeError in incident_edges: {vertices}")
+            return []
+        return list(edges)
+
+    def _watch(self, vertices: List[vertex], edges: List[edge]) -> List[Tuple[str, Any, bool]]:
+        """
+        Record the current liveness of vertices and edges, to be compared by _publish_changes.
+        An edge stored in both directions is only watched once.
+        """
+        watched = [("vertex", v, self.vertex_exists(v)) for v in vertices]
+        seen = set()
+        for e in edges:
+            try:
+                if e in seen or (e[1], e[0]) in seen:
+                    continue
+                seen.add(e)
+            except TypeError:
+                pass  # unhashable edge, it cannot be stored twice anyway
+            watched.append(("edge", e, self.edge_exists(e)))
+        return watched
+
+    def _publish_changes(self, watched: List[Tuple[str, Any, bool]]) -> None:
+        """
+        Publish the watched vertices and edges whose liveness changed since _watch.
+        """
+        changes = []
+        for kind, element, alive_before in watched:
+            alive = self.vertex_exists(element) if kind == "vertex" else self.edge_exists(element)
+            if alive is None or alive == alive_before:
+                continue
+            changes.append(GraphChange(kind, element, alive, self._decisive_timestamp(kind, element, alive)))
+        if changes:
+            self.changes.publish(changes)
+
+    def _decisive_timestamp(self, kind: str, element: Any, alive: bool) -> Optional[timestamp]:
+        """
+        Get the timestamp of the operation that decided the liveness of a vertex or an edge.
+        An edge can also die because one of its vertices was removed.
+        """
+        if kind == "vertex":
+            return self.add_vertices_dict.get(element) if alive else self.remove_vertices_dict.get(element)
+        reverse = (element[1], element[0])
+        if alive:
+            return self.add_edges_dict.get(element, self.add_edges_dict.get(reverse))
+        for v in element:
+            if not self.vertex_exists(v):
+                return self.remove_vertices_dict.get(v)
+        return self.remove_edges_dict.get(element, self.remove_edges_dict.get(reverse))
+
+    def _stored(self, names: Tuple[str, str], key: Any) -> Optional[Tuple[Optional[timestamp], ...]]:
+        """
+        Get the add and remove timestamps stored for a vertex or an edge, None if the key is unhashable.
+        """
+        try:
+            return tuple(getattr(self, name).get(key) for name in names)
+        except TypeError:
+            return None
+
+    def _record_stored(self, names: Tuple[str, str], key: Any, before: Tuple[Optional[timestamp], ...],
+                       record: Callable[[Any, timestamp, bool], None]) -> None:
+        """
+        Record in the history the add and remove timestamps an operation stored,
+        so that operations rejected by the graph are not part of its history.
+        """
+        after = self._stored(names, key)
+        for added, old, new in zip((True, False), before, after):
+            if new is not None and new != old:
+                record(key, new, added)
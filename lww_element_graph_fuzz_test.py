@@ -0,0 +1,282 @@
+"""
+Randomized replica simulator for the LWW-Element-Graph.
+It applies concurrent operation streams to N replicas, merges them in random orders and checks that
+all replicas converge to the same live state, while recording merge time and memory of every scenario.
+After every operation and merge, the changed replica is checked against a reference model.
+"""
+
+import os
+import random
+import time
+import tracemalloc
+import unittest
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from lww_element_graph import Graph
+
+LiveState = Tuple[FrozenSet[int], FrozenSet[FrozenSet[int]], Tuple[Tuple[int, Tuple[int, ...]], ...]]
+
+
+class ScenarioStats(NamedTuple):
+    """ Merge time and memory of a scenario. """
+    replicas: int
+    operations: int
+    merges: int
+    merge_seconds: float
+    peak_memory: int  # bytes
+
+    @property
+    def merges_per_second(self) -> float:
+        return self.merges / self.merge_seconds if self.merge_seconds > 0 else float("inf")
+
+
+class ReferenceReplica:
+    """
+    Reference model of a replica, keeping the latest add and remove timestamp the graph ever stored
+    for every vertex and edge, and merging by taking the latest timestamps.
+    Edges are keyed regardless of direction.
+    """
+
+    def __init__(self):
+        """
+        Initialize the model.
+        """
+        self.added: Dict[Any, float] = {}
+        self.removed: Dict[Any, float] = {}
+
+    def observe_vertex(self, graph: Graph, vertex: int) -> None:
+        """
+        Take the timestamps the graph stored for a vertex.
+        """
+        self._observe(("vertex", vertex), graph.add_vertices_dict.get(vertex), graph.remove_vertices_dict.get(vertex))
+
+    def observe_edge(self, graph: Graph, edge: Tuple[int, int]) -> None:
+        """
+        Take the timestamps the graph stored for an edge, in both directions.
+        """
+        for key in (edge, (edge[1], edge[0])):
+            self._observe(("edge", frozenset(edge)), graph.add_edges_dict.get(key), graph.remove_edges_dict.get(key))
+
+    def merge(self, other) -> None:
+        """
+        Merge another model, keeping the latest timestamps.
+        """
+        for key, timestamp in other.added.items():
+            self._observe(key, timestamp, None)
+        for key, timestamp in other.removed.items():
+            self._observe(key, None, timestamp)
+
+    def vertex_alive(self, vertex: int) -> bool:
+        """
+        Check if a vertex is alive, an addition wins over a removal at the same timestamp.
+        """
+        return self._alive(("vertex", vertex))
+
+    def edge_alive(self, edge: Tuple[int, int]) -> bool:
+        """
+        Check if an edge and both of its vertices are alive.
+        """
+        return self.vertex_alive(edge[0]) and self.vertex_alive(edge[1]) and self._alive(("edge", frozenset(edge)))
+
+    def edges(self) -> List[Tuple[int, int]]:
+        """
+        Get all edges the model has timestamps of.
+        """
+        return [tuple(key[1]) for key in {**self.added, **self.removed} if key[0] == "edge"]
+
+    def _observe(self, key: Any, added: Optional[float], removed: Optional[float]) -> None:
+        if added is not None and self.added.get(key, added) <= added:
+            self.added[key] = added
+        if removed is not None and self.removed.get(key, removed) <= removed:
+            self.removed[key] = removed
+
+    def _alive(self, key: Any) -> bool:
+        return key in self.added and (key not in self.removed or self.added[key] >= self.removed[key])
+
+
+class ReplicaSimulator:
+    """
+    Simulates replicas of a graph receiving concurrent operations and merging with each other.
+    """
+
+    def __init__(self, replicas: int, vertices: int, seed: int):
+        """
+        Initialize the simulator.
+        :param replicas: number of replicas.
+        :param vertices: number of distinct vertices used by the operations.
+        :param seed: seed of the random operation streams and merge orders.
+        """
+        self.random = random.Random(seed)
+        self.vertices = vertices
+        self.graphs = [Graph() for _ in range(replicas)]
+        self.models = [ReferenceReplica() for _ in range(replicas)]
+        self.merges = 0
+        self.merge_seconds = 0.0
+
+    def run(self, operations: int, gossip: float, trace_memory: bool = False) -> ScenarioStats:
+        """
+        Run a scenario and merge all replicas with each other at the end.
+        :param operations: number of operations spread over the replicas.
+        :param gossip: probability of a merge between two random replicas after each operation.
+        :param trace_memory: trace the peak memory, which slows down the scenario and its merges.
+        :return: merge time and memory of the scenario, peak memory is 0 if it was not traced.
+        """
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            for _ in range(operations):
+                self.operate(self.random.randrange(len(self.graphs)), max_timestamp=operations // 4)
+                if len(self.graphs) > 1 and self.random.random() < gossip:
+                    self.merge(*self.random.sample(range(len(self.graphs)), 2))
+            self.merge_all()
+            peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+        return ScenarioStats(len(self.graphs), operations, self.merges, self.merge_seconds, peak_memory)
+
+    def operate(self, replica: int, max_timestamp: int) -> None:
+        """
+        Apply a random operation with a random timestamp, so replicas see ties and out of order timestamps.
+        """
+        graph, model = self.graphs[replica], self.models[replica]
+        timestamp = self.random.randint(0, max_timestamp)
+        v1, v2 = self.random.sample(range(self.vertices), 2)
+        operation = self.random.choice([graph.add_vertex, graph.remove_vertex, graph.add_edge, graph.remove_edge])
+        if operation in (graph.add_edge, graph.remove_edge):
+            operation((v1, v2), timestamp)
+            model.observe_edge(graph, (v1, v2))
+        else:
+            operation(v1, timestamp)
+            model.observe_vertex(graph, v1)
+        self.check(replica, f"{operation.__name__} at {timestamp}")
+
+    def merge(self, replica: int, other_replica: int) -> None:
+        """
+        Merge other_replica into replica, timing the merge.
+        """
+        start = time.perf_counter()
+        self.graphs[replica].merge(self.graphs[other_replica])
+        self.merge_seconds += time.perf_counter() - start
+        self.merges += 1
+        self.models[replica].merge(self.models[other_replica])
+        self.check(replica, f"merge of replica {other_replica}")
+
+    def merge_all(self) -> None:
+        """
+        Merge every replica with all the others, both in random order.
+        """
+        replicas = range(len(self.graphs))
+        for replica in self.random.sample(replicas, len(replicas)):
+            for other_replica in self.random.sample(replicas, len(replicas)):
+                if other_replica != replica:
+                    self.merge(replica, other_replica)
+
+    def check(self, replica: int, step: str) -> None:
+        """
+        Check that a replica agrees with its reference model, that every live vertex has an adjacency list,
+        and that the adjacency lists hold exactly the live edges.
+        :param replica: replica to check.
+        :param step: last step applied to the replica, for the error message.
+        """
+        graph, model = self.graphs[replica], self.models[replica]
+        for v in range(self.vertices):
+            alive = graph.vertex_exists(v)
+            if alive != model.vertex_alive(v):
+                raise AssertionError(f"Replica {replica} after {step}: vertex {v} exists is {alive}.")
+            if alive and v not in graph.vertices_dict:
+                raise AssertionError(f"Replica {replica} after {step}: vertex {v} has no adjacency list.")
+            neighbours = graph.get_vertices(v) if alive else []
+            if len(neighbours) != len(set(neighbours)):
+                raise AssertionError(f"Replica {replica} after {step}: vertex {v} has duplicate neighbours.")
+            for n in neighbours:
+                if not graph.edge_exists((v, n)):
+                    raise AssertionError(f"Replica {replica} after {step}: dead edge {(v, n)} is in adjacency list.")
+        for e in model.edges():
+            alive = graph.edge_exists(e)
+            if alive != model.edge_alive(e):
+                raise AssertionError(f"Replica {replica} after {step}: edge {e} exists is {alive}.")
+            if alive and (e[1] not in graph.get_vertices(e[0]) or e[0] not in graph.get_vertices(e[1])):
+                raise AssertionError(f"Replica {replica} after {step}: live edge {e} is not in adjacency lists.")
+
+    def live_state(self, graph: Graph) -> LiveState:
+        """
+        Get the live vertices, edges and adjacency of a replica.
+        """
+        vertices = frozenset(v for v in range(self.vertices) if graph.vertex_exists(v))
+        edges = frozenset(frozenset((v1, v2)) for v1 in vertices for v2 in vertices
+                          if v1 < v2 and graph.edge_exists((v1, v2)))
+        adjacency = tuple((v, tuple(sorted(graph.get_vertices(v)))) for v in sorted(vertices))
+        return vertices, edges, adjacency
+
+
+class TestConvergence(unittest.TestCase):
+    # Memory is deterministic for a seed, so its budget is asserted on every run.
+    # Throughput depends on the machine, so it is only reported, when LWW_GRAPH_BENCHMARK is set.
+    max_peak_memory_per_operation = 4096  # bytes
+
+    scenarios: List[Dict[str, int]] = [
+        dict(replicas=2, vertices=5, operations=100),
+        dict(replicas=3, vertices=10, operations=300),
+        dict(replicas=5, vertices=20, operations=1000),
+        dict(replicas=8, vertices=50, operations=2000),
+    ]
+
+    def test_replicas_converge(self):
+        """
+        This method tests that replicas receiving concurrent operations
+        converge to the same live state after merging in random orders.
+        """
+        for seed in range(10):
+            for scenario in self.scenarios:
+                with self.subTest(seed=seed, **scenario):
+                    simulator = ReplicaSimulator(scenario["replicas"], scenario["vertices"], seed)
+                    simulator.run(scenario["operations"], gossip=0.1)
+                    states = [simulator.live_state(graph) for graph in simulator.graphs]
+                    self.assertTrue(all(state == states[0] for state in states))
+
+    def test_merge_laws(self):
+        """
+        This method tests that merge is commutative, associative and idempotent
+        on forks of randomly changed replicas.
+        """
+        for seed in range(50):
+            with self.subTest(seed=seed):
+                simulator = ReplicaSimulator(3, 10, seed)
+                for _ in range(60):
+                    simulator.operate(simulator.random.randrange(3), max_timestamp=15)
+                a, b, c = simulator.graphs
+                state = simulator.live_state
+                self.assertEqual(state(a.fork().merge(b)), state(b.fork().merge(a)))
+                self.assertEqual(state(a.fork().merge(b).merge(c)), state(a.fork().merge(b.fork().merge(c))))
+                merged = a.fork().merge(b)
+                self.assertEqual(state(merged.fork().merge(merged)), state(merged))
+                self.assertEqual(state(merged.fork().merge(b)), state(merged))
+
+    def test_merge_memory(self):
+        """
+        This method tests that the peak memory of a scenario stays within the memory budget.
+        """
+        for scenario in self.scenarios:
+            with self.subTest(**scenario):
+                simulator = ReplicaSimulator(scenario["replicas"], scenario["vertices"], seed=0)
+                stats = simulator.run(scenario["operations"], gossip=0.1, trace_memory=True)
+                self.assertLessEqual(stats.peak_memory, self.max_peak_memory_per_operation * stats.operations)
+
+    @unittest.skipUnless(os.environ.get("LWW_GRAPH_BENCHMARK"), "set LWW_GRAPH_BENCHMARK to report merge throughput")
+    def test_merge_throughput(self):
+        """
+        This method reports the merge throughput of every scenario.
+        Memory is not traced, as tracing slows down merges.
+        """
+        for scenario in self.scenarios:
+            simulator = ReplicaSimulator(scenario["replicas"], scenario["vertices"], seed=0)
+            stats = simulator.run(scenario["operations"], gossip=0.1)
+            print(f"{stats}: {stats.merges_per_second:.0f} merges per second")
+
+
+if __name__ == '__main__':
+    for kwargs in TestConvergence.scenarios:
+        simulator = ReplicaSimulator(kwargs["replicas"], kwargs["vertices"], seed=0)
+        print(simulator.run(kwargs["operations"], gossip=0.1, trace_memory=True))
+    unittest.main(verbosity=2)
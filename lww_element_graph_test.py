@@ -1,5 +1,6 @@
+import asyncio
 import unittest
-from lww_element_graph import Graph
+from lww_element_graph import CopyOnWriteDict, Graph, GraphChange
 import time
 
 
@@ -223,6 +224,61 @@ class TestGraph(unittest.TestCase):
         expected_arr: list = []
         self.assertEqual(list(graph.add_vertices_dict.keys()), expected_arr)
 
+    def test_remove_missing_vertex_keeps_latest_removal(self):
+        """
+        This method tests that removing a vertex that does not exist
+        keeps the latest removal timestamp, so an older addition cannot bring it back.
+        """
+        graph = Graph()
+        graph.remove_vertex(1, 20)
+        graph.remove_vertex(1, 14)
+        self.assertEqual(graph.remove_vertices_dict[1], 20)
+        self.assertFalse(graph.add_vertex(1, 17))
+        self.assertFalse(graph.vertex_exists(1))
+        self.assertEqual(graph.get_vertices(1), [])
+
+    def test_edge_timestamps_in_both_directions(self):
+        """
+        This method tests that adding and removing an edge compare the timestamps of both of its directions,
+        so the adjacency lists hold exactly the live edges.
+        """
+        graph = Graph()
+        for v in (1, 2, 3):
+            graph.add_vertex(v, 0)
+        graph.add_edge((1, 2), 5)
+        graph.add_edge((2, 3), 5)
+        graph.remove_edge((2, 1), 10)
+        self.assertFalse(graph.add_edge((1, 2), 7))
+        self.assertFalse(graph.edge_exists((1, 2)))
+        self.assertEqual(graph.get_vertices(1), [])
+        self.assertEqual(graph.find_path(1, 3), [])
+        graph = Graph()
+        graph.add_vertex(1, 0)
+        graph.add_vertex(2, 0)
+        graph.add_edge((1, 2), 5)
+        graph.remove_edge((2, 1), 1)
+        self.assertTrue(graph.edge_exists((1, 2)))
+        self.assertEqual(graph.get_vertices(1), [2])
+        self.assertEqual(graph.get_vertices(2), [1])
+
+    def test_remove_vertex_updates_neighbours(self):
+        """
+        This method tests that removing a vertex removes it from the adjacency lists of its neighbours,
+        and adding it again brings back its live edges.
+        """
+        graph = Graph()
+        for v in (1, 2, 3):
+            graph.add_vertex(v, 0)
+        graph.add_edge((1, 2), 1)
+        graph.add_edge((3, 2), 1)
+        graph.remove_vertex(2, 2)
+        self.assertEqual(graph.get_vertices(1), [])
+        self.assertEqual(graph.get_vertices(3), [])
+        graph.add_vertex(2, 3)
+        self.assertEqual(sorted(graph.get_vertices(2)), [1, 3])
+        self.assertEqual(graph.get_vertices(1), [2])
+        self.assertEqual(graph.find_path(1, 3), [1, 2, 3])
+
     def test_check_vertex_exists(self):
         """
         This method tests vertex_exists method of the graph.
@@ -366,6 +422,297 @@ class TestGraph(unittest.TestCase):
         expected_arr: list = []
         self.assertEqual(list(graph.add_vertices_dict.keys()), expected_arr)
 
+    def test_as_of_vertex_and_edge(self):
+        """
+        This method tests point-in-time queries of vertices and edges
+        through the version history of the graph.
+        """
+        current_timestamp = time.time()
+        graph = Graph(history_limit=8)
+        graph.add_vertex(1, current_timestamp)
+        graph.add_vertex(2, current_timestamp)
+        graph.add_edge((1, 2), current_timestamp + 10)
+        graph.remove_edge((1, 2), current_timestamp + 20)
+        graph.remove_vertex(2, current_timestamp + 30)
+        self.assertFalse(graph.as_of(current_timestamp - 1).vertex_exists(1))
+        self.assertTrue(graph.as_of(current_timestamp).vertex_exists(2))
+        self.assertFalse(graph.as_of(current_timestamp + 5).edge_exists((1, 2)))
+        self.assertTrue(graph.as_of(current_timestamp + 15).edge_exists((2, 1)))
+        self.assertFalse(graph.as_of(current_timestamp + 25).edge_exists((1, 2)))
+        self.assertTrue(graph.as_of(current_timestamp + 25).vertex_exists(2))
+        self.assertFalse(graph.as_of(current_timestamp + 35).vertex_exists(2))
+        self.assertTrue(graph.as_of(current_timestamp + 35).vertex_exists(1))
+
+    def test_as_of_get_vertices_and_find_path(self):
+        """
+        This method tests get_vertices and find_path of a view
+        of the graph as of a past timestamp.
+        """
+        current_timestamp = time.time()
+        graph = Graph(history_limit=8)
+        for vertex in [1, 2, 3]:
+            graph.add_vertex(vertex, current_timestamp)
+        graph.add_edge((1, 2), current_timestamp)
+        graph.add_edge((2, 3), current_timestamp + 10)
+        graph.remove_edge((1, 2), current_timestamp + 20)
+        view = graph.as_of(current_timestamp + 15)
+        self.assertEqual(view.get_vertices(2), [1, 3])
+        self.assertEqual(view.find_path(1, 3), [1, 2, 3])
+        view = graph.as_of(current_timestamp + 5)
+        self.assertEqual(view.get_vertices(2), [1])
+        self.assertEqual(view.find_path(1, 3), [])
+        view = graph.as_of(current_timestamp + 25)
+        self.assertEqual(view.get_vertices(2), [3])
+        self.assertEqual(view.find_path(1, 3), [])
+
+    def test_as_of_merge_and_compaction(self):
+        """
+        This method tests that merged replicas are part of the version history
+        and that the history stays bounded.
+        """
+        current_timestamp = time.time()
+        graph_a = Graph(history_limit=2)
+        graph_b = Graph()
+        graph_a.add_vertex(1, current_timestamp)
+        graph_b.add_vertex(2, current_timestamp + 10)
+        graph_a.merge(graph_b)
+        self.assertFalse(graph_a.as_of(current_timestamp + 5).vertex_exists(2))
+        self.assertTrue(graph_a.as_of(current_timestamp + 10).vertex_exists(2))
+        for i in range(1, 6):
+            graph_a.remove_vertex(1, current_timestamp + 2 * i)
+            graph_a.add_vertex(1, current_timestamp + 2 * i + 1)
+        self.assertEqual(len(graph_a.history.vertex_versions[1]), 2)
+        self.assertTrue(graph_a.as_of(current_timestamp + 11).vertex_exists(1))
+        self.assertFalse(graph_a.as_of(current_timestamp + 10).vertex_exists(1))
+        self.assertEqual(graph_a.as_of(current_timestamp + 5).vertex_exists(1), None)  # before the kept versions
+        graph_a.merge(graph_b)
+        graph_a.merge(graph_b)
+        self.assertEqual(graph_a.history.vertex_versions[2], [(current_timestamp + 10, True)])
+
+    def test_as_of_compaction_with_older_merged_versions(self):
+        """
+        This method tests that versions merged in after compaction, older than the versions kept,
+        do not change the answers between the versions kept.
+        """
+        graph = Graph(history_limit=3)
+        graph.add_vertex(1, 1)
+        replica = Graph()
+        replica.add_vertex(1, 3)
+        graph.merge(replica)
+        graph.remove_vertex(1, 5)
+        graph.add_vertex(1, 7)
+        replica = Graph()
+        replica.add_vertex(1, 0)
+        replica.remove_vertex(1, 2)
+        graph.merge(replica)
+        self.assertNotEqual(graph.as_of(3).vertex_exists(1), False)
+        self.assertFalse(graph.as_of(5).vertex_exists(1))
+        self.assertTrue(graph.as_of(7).vertex_exists(1))
+
+    def test_as_of_merge_carries_horizons(self):
+        """
+        This method tests that merging a replica whose history was compacted carries over its horizons,
+        so the merged graph does not answer before them.
+        """
+        replica = Graph(history_limit=2)
+        for i in range(1, 6):
+            replica.add_vertex(1, 10 * i)
+            replica.remove_vertex(1, 10 * i + 5)
+        self.assertEqual(replica.as_of(12).vertex_exists(1), None)
+        graph = Graph(history_limit=10)
+        graph.merge(replica)
+        self.assertEqual(graph.as_of(12).vertex_exists(1), None)
+        self.assertTrue(graph.as_of(50).vertex_exists(1))
+        self.assertFalse(graph.as_of(55).vertex_exists(1))
+
+    def test_as_of_follows_the_graph(self):
+        """
+        This method tests that operations rejected by the graph are not part of its history,
+        and that an edge has the same history in both directions.
+        """
+        graph = Graph(history_limit=8)
+        graph.add_vertex(1, 0)
+        graph.add_vertex(2, 0)
+        graph.remove_edge((1, 2), 10)  # edge does not exist, so nothing is removed
+        graph.add_edge((1, 2), 5)
+        self.assertTrue(graph.edge_exists((1, 2)))
+        self.assertTrue(graph.as_of(20).edge_exists((1, 2)))
+        graph.remove_edge((2, 1), 30)
+        self.assertFalse(graph.edge_exists((1, 2)))
+        self.assertFalse(graph.as_of(40).edge_exists((1, 2)))
+        self.assertEqual(graph.as_of(40).get_vertices(1), [])
+        self.assertEqual(graph.as_of(20).get_vertices(1), [2])
+
+    def test_as_of_without_history(self):
+        """
+        This method tests that as_of is not available without a version history.
+        """
+        graph = Graph()
+        self.assertEqual(graph.as_of(time.time()), None)
+
+    def test_change_feed_local_operations(self):
+        """
+        This method tests that local operations publish the effective
+        state transitions of vertices and edges to subscribed callbacks.
+        """
+        current_timestamp = time.time()
+        graph = Graph()
+        changes = []
+        graph.changes.subscribe(changes.append)
+        graph.add_vertex(1, current_timestamp)
+        graph.add_vertex(2, current_timestamp)
+        graph.add_vertex(2, current_timestamp + 1)  # already exists, no change
+        graph.add_edge((1, 2), current_timestamp + 2)
+        graph.remove_vertex(2, current_timestamp + 3)
+        self.assertEqual(changes, [
+            GraphChange("vertex", 1, True, current_timestamp),
+            GraphChange("vertex", 2, True, current_timestamp),
+            GraphChange("edge", (1, 2), True, current_timestamp + 2),
+            GraphChange("vertex", 2, False, current_timestamp + 3),
+            GraphChange("edge", (1, 2), False, current_timestamp + 3),
+        ])
+        graph.changes.unsubscribe(changes.append)
+        graph.add_vertex(3, current_timestamp)
+        self.assertEqual(len(changes), 5)
+
+    def test_change_feed_merge(self):
+        """
+        This method tests that merging a replica publishes only the
+        elements whose liveness was flipped by the merge.
+        """
+        current_timestamp = time.time()
+        graph_a = Graph()
+        graph_b = Graph()
+        graph_a.add_vertex(1, current_timestamp)
+        graph_a.add_vertex(2, current_timestamp)
+        graph_b.add_vertex(1, current_timestamp)
+        graph_b.remove_vertex(1, current_timestamp + 10)
+        graph_b.add_vertex(3, current_timestamp + 5)
+        changes = []
+        graph_a.changes.subscribe(changes.append)
+        graph_a.merge(graph_b)
+        self.assertEqual(sorted(changes), sorted([
+            GraphChange("vertex", 1, False, current_timestamp + 10),
+            GraphChange("vertex", 3, True, current_timestamp + 5),
+        ]))
+
+    def test_change_feed_queue(self):
+        """
+        This method tests that a bounded queue subscribed to the change feed
+        keeps the most recent changes.
+        """
+        current_timestamp = time.time()
+        graph = Graph()
+
+        async def consume():
+            queue = graph.changes.subscribe_queue(maxsize=2)
+            for vertex in range(3):
+                graph.add_vertex(vertex, current_timestamp)
+            return [await queue.get() for _ in range(queue.qsize())]
+
+        changes = asyncio.run(consume())
+        self.assertEqual([change.element for change in changes], [1, 2])
+
+    def test_change_feed_queue_join(self):
+        """
+        This method tests that changes dropped from a full queue
+        do not keep the queue from being joined.
+        """
+        current_timestamp = time.time()
+        graph = Graph()
+
+        async def consume():
+            queue = graph.changes.subscribe_queue(maxsize=1)
+            graph.add_vertex(1, current_timestamp)
+            graph.add_vertex(2, current_timestamp)
+            await queue.get()
+            queue.task_done()
+            await asyncio.wait_for(queue.join(), timeout=1)
+
+        asyncio.run(consume())
+
+    def test_change_feed_vertex_added_again(self):
+        """
+        This method tests that adding a removed vertex again publishes
+        its edges becoming live again.
+        """
+        current_timestamp = time.time()
+        graph = Graph()
+        graph.add_vertex(1, current_timestamp)
+        graph.add_vertex(2, current_timestamp)
+        graph.add_edge((1, 2), current_timestamp)
+        graph.remove_vertex(2, current_timestamp + 1)
+        changes = []
+        graph.changes.subscribe(changes.append)
+        graph.add_vertex(2, current_timestamp + 2)
+        self.assertEqual(changes, [
+            GraphChange("vertex", 2, True, current_timestamp + 2),
+            GraphChange("edge", (1, 2), True, current_timestamp),
+        ])
+
+    def test_fork_is_independent(self):
+        """
+        This method tests that a fork and the original graph
+        can be changed without affecting each other.
+        """
+        current_timestamp = time.time()
+        graph = Graph()
+        for vertex in [1, 2, 3]:
+            graph.add_vertex(vertex, current_timestamp)
+        graph.add_edge((1, 2), current_timestamp)
+        fork = graph.fork()
+        self.assertIs(fork.add_edges_dict._base, graph.add_edges_dict._base)  # nothing is copied by the fork
+        fork.add_edge((2, 3), current_timestamp + 1)
+        fork.remove_edge((1, 2), current_timestamp + 1)
+        self.assertEqual(list(fork.add_edges_dict._changes), [(2, 3)])  # only the written edge is stored
+        graph.remove_vertex(3, current_timestamp + 2)
+        self.assertTrue(graph.edge_exists((1, 2)))
+        self.assertFalse(graph.edge_exists((2, 3)))
+        self.assertEqual(graph.get_vertices(2), [1])
+        self.assertFalse(fork.edge_exists((1, 2)))
+        self.assertTrue(fork.edge_exists((2, 3)))
+        self.assertEqual(fork.get_vertices(2), [3])
+        self.assertTrue(fork.vertex_exists(3))
+
+    def test_copy_on_write_dict(self):
+        """
+        This method tests that a copy-on-write dict behaves like a dict
+        without changing the dict it was forked from.
+        """
+        base = {1: [1], 2: [2], 3: [3]}
+        table = CopyOnWriteDict(base)
+        table[4] = [4]
+        del table[2]
+        table[1] = [10]
+        table.own(3, list)
+        table[3].append(30)
+        self.assertEqual(base, {1: [1], 2: [2], 3: [3]})
+        self.assertEqual(list(table.items()), [(1, [10]), (3, [3, 30]), (4, [4])])
+        table[2] = [20]  # added again, so it goes last, like in a dict
+        fork = CopyOnWriteDict(table)
+        fork.pop(4)
+        self.assertEqual(list(table), [1, 3, 4, 2])
+        self.assertEqual(list(fork), [1, 3, 2])
+        self.assertEqual(len(fork), 3)
+        self.assertNotIn(4, fork)
+
+    def test_snapshot_speculative_merge(self):
+        """
+        This method tests a what-if merge on a snapshot, leaving the graph unchanged.
+        """
+        current_timestamp = time.time()
+        graph_a = Graph(history_limit=4)
+        graph_b = Graph()
+        graph_a.add_vertex(1, current_timestamp)
+        graph_b.add_vertex(1, current_timestamp)
+        graph_b.remove_vertex(1, current_timestamp + 10)
+        snapshot = graph_a.snapshot()
+        snapshot.merge(graph_b)
+        self.assertFalse(snapshot.vertex_exists(1))
+        self.assertFalse(snapshot.as_of(current_timestamp + 10).vertex_exists(1))
+        self.assertTrue(graph_a.vertex_exists(1))
+        self.assertTrue(graph_a.as_of(current_timestamp + 10).vertex_exists(1))
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)